@@ -5,13 +5,15 @@ Multi-color 3MF: green base, white QR and label text.
 """
 
 import os
+import functools
 import hashlib
+from typing import NamedTuple
 import qrcode
-from PIL import Image
 import numpy as np
 
 try:
     import cadquery as cq
+    from OCP.BRepMesh import BRepMesh_IncrementalMesh
     CADQUERY_AVAILABLE = True
 except ImportError:
     CADQUERY_AVAILABLE = False
@@ -26,173 +28,253 @@ SIZE_PRESETS = {
     "xlarge": 60,
 }
 
+# CadQuery tessellation tolerances (linear mm, angular radians)
+CQ_TOLERANCE = 0.1
+CQ_ANGULAR_TOLERANCE = 0.2
 
-def generate_qr_code(url, size=200, border=4):
-    """Generate a QR code image from a URL."""
+# Label text font, and where its tessellation is kept between runs (next to this module)
+TEXT_FONT = "Arial"
+TEXT_KIND = "bold"
+TEXT_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache")
+TEXT_CACHE_VERSION = 1  # bump when the cached arrays change meaning
+
+
+@functools.lru_cache(maxsize=32)
+def generate_qr_matrix(url, border=4):
+    """Generate the QR module grid for a URL (1=black/QR square), quiet-zone border included.
+
+    Cached per URL; the returned array is read-only since it is shared between callers.
+    """
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=10,
         border=border,
     )
     qr.add_data(url)
     qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    img = img.resize((size, size))
-    return img
-
-
-def qr_to_array(qr_image):
-    """Convert QR code image to numpy array (0=white, 1=black/QR square)."""
-    img_array = np.array(qr_image.convert('L'))
-    binary = (img_array < 128).astype(int)
-    return binary
-
-
-def create_box_triangles(x, y, z, width, depth, height):
-    """Create triangles for a box. Returns array of 12 triangles."""
-    v = np.array([
-        [x - width/2, y - depth/2, z],
-        [x + width/2, y - depth/2, z],
-        [x + width/2, y + depth/2, z],
-        [x - width/2, y + depth/2, z],
-        [x - width/2, y - depth/2, z + height],
-        [x + width/2, y - depth/2, z + height],
-        [x + width/2, y + depth/2, z + height],
-        [x - width/2, y + depth/2, z + height],
-    ])
-    
-    triangles = np.array([
-        [v[0], v[2], v[1]], [v[0], v[3], v[2]],  # Bottom
-        [v[4], v[5], v[6]], [v[4], v[6], v[7]],  # Top
-        [v[0], v[1], v[5]], [v[0], v[5], v[4]],  # Front
-        [v[2], v[3], v[7]], [v[2], v[7], v[6]],  # Back
-        [v[0], v[4], v[7]], [v[0], v[7], v[3]],  # Left
-        [v[1], v[2], v[6]], [v[1], v[6], v[5]],  # Right
-    ])
-    return triangles
+    matrix = np.array(qr.get_matrix(), dtype=np.uint8)
+    matrix.flags.writeable = False
+    return matrix
+
+
+# Unit box (centered in XY, bottom at Z=0) and its 12 triangles as corner indices
+UNIT_BOX_VERTICES = np.array([
+    [-0.5, -0.5, 0], [0.5, -0.5, 0], [0.5, 0.5, 0], [-0.5, 0.5, 0],
+    [-0.5, -0.5, 1], [0.5, -0.5, 1], [0.5, 0.5, 1], [-0.5, 0.5, 1],
+])
+BOX_FACES = np.array([
+    [0, 2, 1], [0, 3, 2],  # Bottom
+    [4, 5, 6], [4, 6, 7],  # Top
+    [0, 1, 5], [0, 5, 4],  # Front
+    [2, 3, 7], [2, 7, 6],  # Back
+    [0, 4, 7], [0, 7, 3],  # Left
+    [1, 2, 6], [1, 6, 5],  # Right
+])
+
+
+def greedy_rects(qr_array):
+    """Cover the dark QR modules with non-overlapping rectangles. Returns (K, 4) rows of (i0, j0, h, w)."""
+    todo = qr_array == 1
+    rows, cols = todo.shape
+    rects = []
+    for i in range(rows):
+        row = todo[i]
+        for j0 in np.flatnonzero(row).tolist():
+            if not row[j0]:
+                continue  # already covered by a taller rectangle from above
+            # Grow right along the row, then down while the whole span stays dark
+            j1 = j0 + 1
+            while j1 < cols and row[j1]:
+                j1 += 1
+            i1 = i + 1
+            while i1 < rows and todo[i1, j0:j1].all():
+                i1 += 1
+            todo[i:i1, j0:j1] = False
+            rects.append((i, j0, i1 - i, j1 - j0))
+    return np.array(rects, dtype=np.intp).reshape(-1, 4)
+
+
+def create_qr_boxes(qr_array, pixel_size, z, square_size, height, y_offset=0):
+    """
+    Create one box per rectangle of dark QR squares. Returns (vertices, faces), 8 corners/12 faces per box.
+    Each box keeps the (pixel_size - square_size) gap of a single square around its outer edge, so the
+    outline against light squares matches per-square boxes. Inside a dark region the gap only remains
+    where two greedy rectangles meet; that is intended, as the seams stay on module boundaries.
+    """
+    rows, cols = qr_array.shape
+    i0, j0, h, w = greedy_rects(qr_array).T.astype(float)
+    gap = pixel_size - square_size
+
+    centers = np.stack([
+        (j0 + w/2 - cols/2) * pixel_size,
+        (rows/2 - i0 - h/2) * pixel_size + y_offset,
+        np.full(len(i0), z),
+    ], axis=1)
+    sizes = np.stack([w * pixel_size - gap, h * pixel_size - gap, np.full(len(i0), height)], axis=1)
+
+    # Scale a unit box and offset one copy per rectangle: (K, 8, 3) corners, (K, 12, 3) faces
+    vertices = UNIT_BOX_VERTICES[None] * sizes[:, None, :] + centers[:, None, :]
+    faces = BOX_FACES[None] + 8 * np.arange(len(centers))[:, None, None]
+    return vertices.reshape(-1, 3), faces.reshape(-1, 3)
+
+
+class Dims(NamedTuple):
+    """Plate dimensions in mm, all scaled from qr_size_mm."""
+    qr_size_mm: float
+    margin: float
+    text_area_height: float
+    corner_radius: float
+    text_size: float
+    text_y_offset: float
 
 
 def get_dimensions(qr_size_mm):
     """Calculate all dimensions scaled proportionally from qr_size_mm."""
     scale = qr_size_mm / 42  # 42mm was the tuned reference size
-    return {
-        "qr_size_mm": qr_size_mm,
-        "margin": 2 * scale,
-        "text_area_height": 5 * scale,
-        "corner_radius": 2.5 * scale,
-        "text_size": 4.2 * scale,
-        "text_y_offset": 1.8 * scale,
-    }
+    return Dims(
+        qr_size_mm=qr_size_mm,
+        margin=2 * scale,
+        text_area_height=5 * scale,
+        corner_radius=2.5 * scale,
+        text_size=4.2 * scale,
+        text_y_offset=1.8 * scale,
+    )
 
 
-def create_3d_qr_code_multicolor(url, output_file, qr_size_mm=50, base_height=1.8, qr_height=0.9, text_height=1.2):
-    """
-    Create a 3MF file with two separate colored meshes for Bambu AMS.
-    - Base mesh (green)
-    - QR + text mesh (white)
-    """
+def cq_to_mesh(workplane, tolerance=CQ_TOLERANCE, angular_tolerance=CQ_ANGULAR_TOLERANCE):
+    """Tessellate a CadQuery workplane's shape in memory. Returns a trimesh.Trimesh."""
     import trimesh
-    import zipfile
-    
-    print("  Generating QR code...")
-    qr_img = generate_qr_code(url, size=200)
-    qr_array = qr_to_array(qr_img)
-    
-    dims = get_dimensions(qr_size_mm)
-    pixel_size = dims["qr_size_mm"] / qr_array.shape[0]
-    total_height = dims["text_area_height"] + dims["qr_size_mm"] + 2 * dims["margin"]
-    total_width = dims["qr_size_mm"] + 2 * dims["margin"]
-    
-    print(f"  Model size: {total_width:.1f}mm x {total_height:.1f}mm")
-    print("  Building base mesh (green) with rounded corners...")
-    
-    # Base mesh with rounded corners (using CadQuery)
-    if CADQUERY_AVAILABLE:
-        import tempfile
-        base_cq = (cq.Workplane("XY")
-            .box(total_width, total_height, base_height)
-            .edges("|Z")
-            .fillet(dims["corner_radius"])
-            .translate((0, 0, base_height/2))  # Move up so bottom is at Z=0
-        )
-        temp = tempfile.NamedTemporaryFile(suffix='.stl', delete=False)
-        temp.close()
-        cq.exporters.export(base_cq, temp.name)
-        base_mesh = trimesh.load(temp.name)
-        os.unlink(temp.name)
-    else:
-        # Fallback to square corners
-        base_triangles = np.array(create_box_triangles(0, 0, 0, total_width, total_height, base_height))
-        base_vertices = base_triangles.reshape(-1, 3)
-        base_faces = np.arange(len(base_vertices)).reshape(-1, 3)
-        base_mesh = trimesh.Trimesh(vertices=base_vertices, faces=base_faces)
-        base_mesh.merge_vertices()
-    
-    print("  Building QR pattern mesh (white)...")
-    
-    # QR squares mesh
-    qr_offset_y = -dims["text_area_height"] / 2
-    square_size = pixel_size * 0.95
-    qr_triangles = []
-    
-    for i in range(qr_array.shape[0]):
-        for j in range(qr_array.shape[1]):
-            if qr_array[i, j] == 1:
-                x = (j - qr_array.shape[1]/2) * pixel_size
-                y = (qr_array.shape[0]/2 - i) * pixel_size + qr_offset_y
-                square_triangles = create_box_triangles(x, y, base_height, square_size, square_size, qr_height)
-                qr_triangles.extend(square_triangles)
-    
-    qr_triangles = np.array(qr_triangles)
-    qr_vertices = qr_triangles.reshape(-1, 3)
-    qr_faces = np.arange(len(qr_vertices)).reshape(-1, 3)
-    qr_mesh = trimesh.Trimesh(vertices=qr_vertices, faces=qr_faces)
-    qr_mesh.merge_vertices()
-    
-    text_y = total_height/2 - dims["text_area_height"]/2 - dims["text_y_offset"]
-    
-    if CADQUERY_AVAILABLE:
-        print("  Adding text mesh...")
+
+    shape = workplane.val()
+    # Mesh faces on all cores first; tessellate() reuses the existing triangulation
+    BRepMesh_IncrementalMesh(shape.wrapped, tolerance, True, angular_tolerance, True)
+    vertices, triangles = shape.tessellate(tolerance, angular_tolerance)
+    return trimesh.Trimesh(
+        vertices=np.array([v.toTuple() for v in vertices]),
+        faces=np.array(triangles),
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _rounded_slab_mesh(width, depth, height, corner_radius, z):
+    """Tessellated CadQuery rounded slab; cached since OCCT meshing is the slow step."""
+    # Fillet the 2D outline and extrude once, rather than filleting 4 solid edges in 3D
+    base_cq = (cq.Workplane("XY")
+        .workplane(offset=z)
+        .sketch()
+        .rect(width, depth)
+        .vertices()
+        .fillet(corner_radius)
+        .finalize()
+        .extrude(height)
+    )
+    return cq_to_mesh(base_cq)
+
+
+def _cadquery_versions():
+    """Installed CadQuery and OCP versions, so the text cache follows kernel upgrades."""
+    from importlib import metadata
+    import OCP
+
+    ocp_version = getattr(OCP, "__version__", None)
+    for dist in ("cadquery-ocp", "ocp"):
+        if ocp_version:
+            break
         try:
-            import tempfile
-            
-            text_obj = cq.Workplane("XY").workplane(offset=base_height).center(0, text_y).text(
-                "https://treasures.to", dims["text_size"], text_height, font="Arial", kind="bold"
-            )
-            
-            temp_file = tempfile.NamedTemporaryFile(suffix='.stl', delete=False)
-            temp_file.close()
-            cq.exporters.export(text_obj, temp_file.name)
-            
-            text_mesh = trimesh.load(temp_file.name)
-            os.unlink(temp_file.name)
-            
-            qr_mesh = trimesh.util.concatenate([qr_mesh, text_mesh])
-        except Exception as e:
-            print(f"  Warning: Could not add text ({e})")
-    
-    print("  Creating 3MF with embedded color assignments...")
-    
-    def mesh_to_3mf_xml(mesh_obj, object_id):
-        verts = mesh_obj.vertices
-        faces = mesh_obj.faces
-        
-        vertices_xml = ""
-        for v in verts:
-            vertices_xml += f'          <vertex x="{v[0]:.6f}" y="{v[1]:.6f}" z="{v[2]:.6f}" />\n'
-        
-        triangles_xml = ""
-        for f in faces:
-            triangles_xml += f'          <triangle v1="{f[0]}" v2="{f[1]}" v3="{f[2]}" pid="1" p1="{object_id-1}" />\n'
-        
-        return vertices_xml, triangles_xml
-    
-    base_verts, base_tris = mesh_to_3mf_xml(base_mesh, 1)
-    qr_verts, qr_tris = mesh_to_3mf_xml(qr_mesh, 2)
-    
-    model_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
+            ocp_version = metadata.version(dist)
+        except metadata.PackageNotFoundError:
+            pass
+    return getattr(cq, "__version__", None), ocp_version
+
+
+def _text_arrays(text, text_size, height):
+    """(vertices, faces) of CadQuery label text at the origin, cached on disk across runs."""
+    key = repr((
+        TEXT_CACHE_VERSION, text, text_size, height, TEXT_FONT, TEXT_KIND,
+        CQ_TOLERANCE, CQ_ANGULAR_TOLERANCE, _cadquery_versions(),
+    ))
+    path = os.path.join(TEXT_CACHE_DIR, f"text_{hashlib.sha256(key.encode()).hexdigest()[:16]}.npz")
+    try:
+        with np.load(path) as cached:
+            return cached["vertices"], cached["faces"]
+    except Exception:
+        pass  # missing, empty or corrupt entry: rebuild and overwrite it below
+
+    text_obj = cq.Workplane("XY").text(text, text_size, height, font=TEXT_FONT, kind=TEXT_KIND)
+    mesh = cq_to_mesh(text_obj)
+    vertices, faces = np.asarray(mesh.vertices), np.asarray(mesh.faces)
+    # Write then rename, so parallel workers never read a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vertices=vertices, faces=faces)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"  Warning: Could not cache text mesh ({e})")
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass  # already renamed into place, or never created
+    return vertices, faces
+
+
+@functools.lru_cache(maxsize=32)
+def _text_mesh(text, text_size, height, y, z):
+    """Label text mesh moved to (0, y, z); cached since the label rarely changes."""
+    import trimesh
+
+    vertices, faces = _text_arrays(text, text_size, height)
+    return trimesh.Trimesh(vertices=vertices + [0, y, z], faces=faces, process=False)
+
+
+def build_text_mesh(text, text_size, height, y=0, z=0):
+    """Build label text centered at (0, y) with its bottom at Z=z (requires CadQuery)."""
+    return _text_mesh(text, text_size, height, y, z).copy()
+
+
+def build_base_mesh(width, depth, height, corner_radius, z=0):
+    """Build a slab with its bottom at Z=z: rounded corners via CadQuery, else square."""
+    import trimesh
+
+    # Validate before branching so the result doesn't depend on CadQuery being installed
+    if 2 * corner_radius >= min(width, depth):
+        raise ValueError(f"corner_radius {corner_radius} too large for a {width} x {depth} slab")
+    if CADQUERY_AVAILABLE:
+        return _rounded_slab_mesh(width, depth, height, corner_radius, z).copy()
+
+    # Fallback to square corners: one box, 8 shared corners
+    base_vertices = UNIT_BOX_VERTICES * [width, depth, height] + [0, 0, z]
+    return trimesh.Trimesh(vertices=base_vertices, faces=BOX_FACES, process=False)
+
+
+def stack_meshes(meshes):
+    """Combine spatially disjoint meshes by stacking their arrays (no welding or processing)."""
+    import trimesh
+
+    offsets = np.cumsum([0] + [len(m.vertices) for m in meshes[:-1]])
+    return trimesh.Trimesh(
+        vertices=np.vstack([m.vertices for m in meshes]),
+        faces=np.vstack([m.faces + offset for m, offset in zip(meshes, offsets)]),
+        process=False,
+    )
+
+
+def mesh_to_3mf_xml(mesh_obj, material_index):
+    """Serialize a trimesh to 3MF vertex/triangle XML fragments."""
+    verts = mesh_obj.vertices
+    faces = mesh_obj.faces
+
+    # One %-format over the repeated line template formats every row in C
+    vertex_fmt = '          <vertex x="%.6f" y="%.6f" z="%.6f" />\n'
+    triangle_fmt = f'          <triangle v1="%d" v2="%d" v3="%d" pid="1" p1="{material_index}" />\n'
+    vertices_xml = (vertex_fmt * len(verts)) % tuple(verts.ravel().tolist())
+    triangles_xml = (triangle_fmt * len(faces)) % tuple(faces.ravel().tolist())
+    return vertices_xml, triangles_xml
+
+
+MODEL_XML_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
 <model unit="millimeter" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02" xmlns:m="http://schemas.microsoft.com/3dmanufacturing/material/2015/02">
   <metadata name="Application">TreasureQR Generator</metadata>
   <resources>
@@ -200,72 +282,140 @@ def create_3d_qr_code_multicolor(url, output_file, qr_size_mm=50, base_height=1.
       <m:base name="Green" displaycolor="#00AA00" />
       <m:base name="White" displaycolor="#FFFFFF" />
     </m:basematerials>
-    <object id="1" name="base_green" type="model">
-      <mesh>
-        <vertices>
-{base_verts}        </vertices>
-        <triangles>
-{base_tris}        </triangles>
-      </mesh>
-    </object>
-    <object id="2" name="qr_white" type="model">
-      <mesh>
-        <vertices>
-{qr_verts}        </vertices>
-        <triangles>
-{qr_tris}        </triangles>
-      </mesh>
-    </object>
-    <object id="3" name="treasure_qr" type="model">
+'''
+
+
+def write_3mf_model(zf, layers, groups):
+    """
+    Stream 3D/3dmodel.model into an open 3MF zip, one mesh object at a time.
+    layers is a list of (name, mesh, extruder): object ids 1..N, material index extruder-1.
+    groups is a list of (name, [object ids]): composite objects N+1.., one build item each.
+    With no groups, every layer object is its own build item.
+    """
+    with zf.open('3D/3dmodel.model', 'w') as f:
+        f.write(MODEL_XML_HEADER.encode())
+        for object_id, (name, mesh_obj, extruder) in enumerate(layers, 1):
+            verts_xml, tris_xml = mesh_to_3mf_xml(mesh_obj, extruder - 1)
+            f.write(f'    <object id="{object_id}" name="{name}" type="model">\n      <mesh>\n        <vertices>\n'.encode())
+            f.write(verts_xml.encode())
+            f.write(b'        </vertices>\n        <triangles>\n')
+            f.write(tris_xml.encode())
+            f.write(b'        </triangles>\n      </mesh>\n    </object>\n')
+
+        build_ids = list(range(1, len(layers) + 1))
+        if groups:
+            build_ids = []
+            for group_id, (group_name, object_ids) in enumerate(groups, len(layers) + 1):
+                components = "".join(f'        <component objectid="{i}" />\n' for i in object_ids)
+                f.write(f'''    <object id="{group_id}" name="{group_name}" type="model">
       <components>
-        <component objectid="1" />
-        <component objectid="2" />
-      </components>
+{components}      </components>
     </object>
-  </resources>
+'''.encode())
+                build_ids.append(group_id)
+
+        items = "".join(f'    <item objectid="{i}" />\n' for i in build_ids)
+        f.write(f'''  </resources>
   <build>
-    <item objectid="3" />
-  </build>
-</model>'''
-    
-    content_types_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+{items}  </build>
+</model>'''.encode())
+
+
+CONTENT_TYPES_XML = '''<?xml version="1.0" encoding="UTF-8"?>
 <Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
   <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml" />
   <Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml" />
   <Default Extension="config" ContentType="text/xml" />
 </Types>'''
-    
-    rels_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+
+RELS_XML = '''<?xml version="1.0" encoding="UTF-8"?>
 <Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
   <Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel" />
 </Relationships>'''
-    
-    model_settings_config = '''<?xml version="1.0" encoding="UTF-8"?>
-<config>
-  <object id="1">
-    <metadata key="extruder" value="1"/>
-    <metadata key="name" value="base_green"/>
-  </object>
-  <object id="2">
-    <metadata key="extruder" value="2"/>
-    <metadata key="name" value="qr_white"/>
+
+
+def model_settings_xml(layers, groups):
+    """Bambu Studio config assigning each layer object/part its AMS extruder."""
+    config = "".join(f'''  <object id="{i}">
+    <metadata key="extruder" value="{extruder}"/>
+    <metadata key="name" value="{name}"/>
   </object>
-  <object id="3">
-    <metadata key="name" value="treasure_qr"/>
-    <part id="1">
-      <metadata key="extruder" value="1"/>
+''' for i, (name, _, extruder) in enumerate(layers, 1))
+    for group_id, (group_name, object_ids) in enumerate(groups, len(layers) + 1):
+        parts = "".join(f'''    <part id="{i}">
+      <metadata key="extruder" value="{layers[i - 1][2]}"/>
     </part>
-    <part id="2">
-      <metadata key="extruder" value="2"/>
-    </part>
-  </object>
-</config>'''
+''' for i in object_ids)
+        config += f'''  <object id="{group_id}">
+    <metadata key="name" value="{group_name}"/>
+{parts}  </object>
+'''
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<config>
+{config}</config>'''
+
+
+def write_3mf(output_file, layers, groups):
+    """Write a multi-color 3MF from (name, mesh, extruder) layers and (name, [object ids]) groups."""
+    import zipfile
+
+    with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+        zf.writestr('_rels/.rels', RELS_XML)
+        write_3mf_model(zf, layers, groups)
+        zf.writestr('Metadata/model_settings.config', model_settings_xml(layers, groups))
+
+
+def plate_layout(qr_array, qr_size_mm):
+    """Shared plate geometry: (dims, pixel_size, total_width, total_height)."""
+    dims = get_dimensions(qr_size_mm)
+    pixel_size = dims.qr_size_mm / qr_array.shape[0]
+    total_height = dims.text_area_height + dims.qr_size_mm + 2 * dims.margin
+    total_width = dims.qr_size_mm + 2 * dims.margin
+    return dims, pixel_size, total_width, total_height
+
+
+def build_qr_layer(qr_array, dims, pixel_size, total_height, z, height, text_height, text_message="Adding text mesh..."):
+    """White layer: QR squares plus the treasures.to text (when CadQuery is available)."""
+    import trimesh
+
+    qr_offset_y = -dims.text_area_height / 2
+    square_size = pixel_size * 0.95
+    qr_vertices, qr_faces = create_qr_boxes(qr_array, pixel_size, z, square_size, height, y_offset=qr_offset_y)
+    # Boxes are disjoint and already indexed, so skip trimesh's vertex welding
+    qr_mesh = trimesh.Trimesh(vertices=qr_vertices, faces=qr_faces, process=False)
+
+    text_y = total_height/2 - dims.text_area_height/2 - dims.text_y_offset
+
+    if CADQUERY_AVAILABLE:
+        print(f"  {text_message}")
+        try:
+            text_mesh = build_text_mesh("https://treasures.to", dims.text_size, text_height, y=text_y, z=z)
+            qr_mesh = stack_meshes([qr_mesh, text_mesh])
+        except Exception as e:
+            print(f"  Warning: Could not add text ({e})")
+    return qr_mesh
+
+
+def create_3d_qr_code_multicolor(url, output_file, qr_size_mm=50, base_height=1.8, qr_height=0.9, text_height=1.2):
+    """
+    Create a 3MF file with two separate colored meshes for Bambu AMS.
+    - Base mesh (green)
+    - QR + text mesh (white)
+    """
+    print("  Generating QR code...")
+    qr_array = generate_qr_matrix(url)
+    dims, pixel_size, total_width, total_height = plate_layout(qr_array, qr_size_mm)
     
-    with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr('[Content_Types].xml', content_types_xml)
-        zf.writestr('_rels/.rels', rels_xml)
-        zf.writestr('3D/3dmodel.model', model_xml)
-        zf.writestr('Metadata/model_settings.config', model_settings_config)
+    print(f"  Model size: {total_width:.1f}mm x {total_height:.1f}mm")
+    print("  Building base mesh (green) with rounded corners...")
+    base_mesh = build_base_mesh(total_width, total_height, base_height, dims.corner_radius)
+    
+    print("  Building QR pattern mesh (white)...")
+    qr_mesh = build_qr_layer(qr_array, dims, pixel_size, total_height, base_height, qr_height, text_height)
+    
+    print("  Creating 3MF with embedded color assignments...")
+    write_3mf(output_file, [("base_green", base_mesh, 1), ("qr_white", qr_mesh, 2)], [("treasure_qr", [1, 2])])
     
     print(f"✓ Created multi-color 3MF: {output_file}")
 
@@ -276,206 +426,27 @@ def create_3d_qr_code_inlay(url, output_file, qr_size_mm=50, base_height=1.8, in
     - Base + background fill (green)
     - QR pattern inlaid flush with background (white)
     """
-    import trimesh
-    import zipfile
-    
     print("  Generating QR code (inlay mode)...")
-    qr_img = generate_qr_code(url, size=200)
-    qr_array = qr_to_array(qr_img)
-    
-    dims = get_dimensions(qr_size_mm)
-    pixel_size = dims["qr_size_mm"] / qr_array.shape[0]
-    total_height = dims["text_area_height"] + dims["qr_size_mm"] + 2 * dims["margin"]
-    total_width = dims["qr_size_mm"] + 2 * dims["margin"]
+    qr_array = generate_qr_matrix(url)
+    dims, pixel_size, total_width, total_height = plate_layout(qr_array, qr_size_mm)
     
     print(f"  Model size: {total_width:.1f}mm x {total_height:.1f}mm (flat top)")
     print("  Building base mesh (green) with rounded corners...")
-    
-    # Base mesh with rounded corners (using CadQuery)
-    if CADQUERY_AVAILABLE:
-        import tempfile
-        # Full height base (base_height + inlay_height) but we'll cut out the QR area
-        base_cq = (cq.Workplane("XY")
-            .box(total_width, total_height, base_height)
-            .edges("|Z")
-            .fillet(dims["corner_radius"])
-            .translate((0, 0, base_height/2))  # Move up so bottom is at Z=0
-        )
-        temp = tempfile.NamedTemporaryFile(suffix='.stl', delete=False)
-        temp.close()
-        cq.exporters.export(base_cq, temp.name)
-        base_mesh = trimesh.load(temp.name)
-        os.unlink(temp.name)
-    else:
-        # Fallback to square corners
-        base_triangles = np.array(create_box_triangles(0, 0, 0, total_width, total_height, base_height))
-        base_vertices = base_triangles.reshape(-1, 3)
-        base_faces = np.arange(len(base_vertices)).reshape(-1, 3)
-        base_mesh = trimesh.Trimesh(vertices=base_vertices, faces=base_faces)
-        base_mesh.merge_vertices()
+    base_mesh = build_base_mesh(total_width, total_height, base_height, dims.corner_radius)
     
     print("  Building inlay layer (full surface)...")
-    
-    qr_offset_y = -dims["text_area_height"] / 2
-    square_size = pixel_size * 0.95
-    
     # Full green top layer (covers entire surface)
-    if CADQUERY_AVAILABLE:
-        green_top_cq = (cq.Workplane("XY")
-            .box(total_width, total_height, inlay_height)
-            .edges("|Z")
-            .fillet(dims["corner_radius"])
-            .translate((0, 0, base_height + inlay_height/2))
-        )
-        temp = tempfile.NamedTemporaryFile(suffix='.stl', delete=False)
-        temp.close()
-        cq.exporters.export(green_top_cq, temp.name)
-        green_top_mesh = trimesh.load(temp.name)
-        os.unlink(temp.name)
-        base_mesh = trimesh.util.concatenate([base_mesh, green_top_mesh])
-    else:
-        # Fallback - full rectangle top layer
-        green_top_triangles = np.array(create_box_triangles(0, 0, base_height, total_width, total_height, inlay_height))
-        green_top_vertices = green_top_triangles.reshape(-1, 3)
-        green_top_faces = np.arange(len(green_top_vertices)).reshape(-1, 3)
-        green_top_mesh = trimesh.Trimesh(vertices=green_top_vertices, faces=green_top_faces)
-        green_top_mesh.merge_vertices()
-        base_mesh = trimesh.util.concatenate([base_mesh, green_top_mesh])
+    green_top_mesh = build_base_mesh(total_width, total_height, inlay_height, dims.corner_radius, z=base_height)
+    base_mesh = stack_meshes([base_mesh, green_top_mesh])
     
-    # White squares (QR pattern - where QR is black/1)
-    white_triangles = []
-    
-    for i in range(qr_array.shape[0]):
-        for j in range(qr_array.shape[1]):
-            if qr_array[i, j] == 1:
-                x = (j - qr_array.shape[1]/2) * pixel_size
-                y = (qr_array.shape[0]/2 - i) * pixel_size + qr_offset_y
-                square_triangles = create_box_triangles(x, y, base_height, square_size, square_size, inlay_height)
-                white_triangles.extend(square_triangles)
-    
-    # White QR mesh
-    white_triangles = np.array(white_triangles)
-    white_vertices = white_triangles.reshape(-1, 3)
-    white_faces = np.arange(len(white_vertices)).reshape(-1, 3)
-    qr_mesh = trimesh.Trimesh(vertices=white_vertices, faces=white_faces)
-    qr_mesh.merge_vertices()
-    
-    # Add text (also inlaid white)
-    text_y = total_height/2 - dims["text_area_height"]/2 - dims["text_y_offset"]
-    
-    if CADQUERY_AVAILABLE:
-        print("  Adding inlaid text mesh...")
-        try:
-            import tempfile
-            
-            text_obj = cq.Workplane("XY").workplane(offset=base_height).center(0, text_y).text(
-                "https://treasures.to", dims["text_size"], inlay_height, font="Arial", kind="bold"
-            )
-            
-            temp_file = tempfile.NamedTemporaryFile(suffix='.stl', delete=False)
-            temp_file.close()
-            cq.exporters.export(text_obj, temp_file.name)
-            
-            text_mesh = trimesh.load(temp_file.name)
-            os.unlink(temp_file.name)
-            
-            qr_mesh = trimesh.util.concatenate([qr_mesh, text_mesh])
-        except Exception as e:
-            print(f"  Warning: Could not add text ({e})")
+    # White squares + text (QR pattern - where QR is black/1), inlaid flush
+    qr_mesh = build_qr_layer(
+        qr_array, dims, pixel_size, total_height, base_height, inlay_height, inlay_height,
+        text_message="Adding inlaid text mesh...",
+    )
     
     print("  Creating 3MF with embedded color assignments...")
-    
-    def mesh_to_3mf_xml(mesh_obj, object_id):
-        verts = mesh_obj.vertices
-        faces = mesh_obj.faces
-        
-        vertices_xml = ""
-        for v in verts:
-            vertices_xml += f'          <vertex x="{v[0]:.6f}" y="{v[1]:.6f}" z="{v[2]:.6f}" />\n'
-        
-        triangles_xml = ""
-        for f in faces:
-            triangles_xml += f'          <triangle v1="{f[0]}" v2="{f[1]}" v3="{f[2]}" pid="1" p1="{object_id-1}" />\n'
-        
-        return vertices_xml, triangles_xml
-    
-    base_verts, base_tris = mesh_to_3mf_xml(base_mesh, 1)
-    qr_verts, qr_tris = mesh_to_3mf_xml(qr_mesh, 2)
-    
-    model_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
-<model unit="millimeter" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02" xmlns:m="http://schemas.microsoft.com/3dmanufacturing/material/2015/02">
-  <metadata name="Application">TreasureQR Generator</metadata>
-  <resources>
-    <m:basematerials id="1">
-      <m:base name="Green" displaycolor="#00AA00" />
-      <m:base name="White" displaycolor="#FFFFFF" />
-    </m:basematerials>
-    <object id="1" name="base_green" type="model">
-      <mesh>
-        <vertices>
-{base_verts}        </vertices>
-        <triangles>
-{base_tris}        </triangles>
-      </mesh>
-    </object>
-    <object id="2" name="qr_white" type="model">
-      <mesh>
-        <vertices>
-{qr_verts}        </vertices>
-        <triangles>
-{qr_tris}        </triangles>
-      </mesh>
-    </object>
-    <object id="3" name="treasure_qr_inlay" type="model">
-      <components>
-        <component objectid="1" />
-        <component objectid="2" />
-      </components>
-    </object>
-  </resources>
-  <build>
-    <item objectid="3" />
-  </build>
-</model>'''
-    
-    content_types_xml = '''<?xml version="1.0" encoding="UTF-8"?>
-<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
-  <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml" />
-  <Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml" />
-  <Default Extension="config" ContentType="text/xml" />
-</Types>'''
-    
-    rels_xml = '''<?xml version="1.0" encoding="UTF-8"?>
-<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
-  <Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel" />
-</Relationships>'''
-    
-    model_settings_config = '''<?xml version="1.0" encoding="UTF-8"?>
-<config>
-  <object id="1">
-    <metadata key="extruder" value="1"/>
-    <metadata key="name" value="base_green"/>
-  </object>
-  <object id="2">
-    <metadata key="extruder" value="2"/>
-    <metadata key="name" value="qr_white"/>
-  </object>
-  <object id="3">
-    <metadata key="name" value="treasure_qr_inlay"/>
-    <part id="1">
-      <metadata key="extruder" value="1"/>
-    </part>
-    <part id="2">
-      <metadata key="extruder" value="2"/>
-    </part>
-  </object>
-</config>'''
-    
-    with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr('[Content_Types].xml', content_types_xml)
-        zf.writestr('_rels/.rels', rels_xml)
-        zf.writestr('3D/3dmodel.model', model_xml)
-        zf.writestr('Metadata/model_settings.config', model_settings_config)
+    write_3mf(output_file, [("base_green", base_mesh, 1), ("qr_white", qr_mesh, 2)], [("treasure_qr_inlay", [1, 2])])
     
     print(f"✓ Created inlay 3MF: {output_file}")
 
@@ -493,6 +464,8 @@ def parse_size(size_arg):
 
 def generate(url, output_file, size="medium", style="raised"):
     """Main generation function."""
+    if style not in ("raised", "inlay"):
+        raise ValueError(f"Unknown style {style!r} (use 'raised' or 'inlay').")
     qr_size_mm = parse_size(size)
     
     # Ensure output directory exists
@@ -4,7 +4,12 @@ Batch wrapper over generate_3d_qr.generate(): reads a URL list file → qr_01.3m
 """
 
 import argparse
+import contextlib
+import io
 import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 
 from generate_3d_qr import OUTPUT_DIR, generate as generate_qr_plate
 from generate_container import BODY_HEIGHT_MODES, DEFAULT_TEMPLATE, generate_container
@@ -20,6 +25,30 @@ def load_urls_from_file(path):
     return urls
 
 
+def run_captured(task, url, output_file):
+    """Worker entry: run one job with its progress output captured, so parallel jobs don't interleave."""
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            task(url, output_file)
+    except Exception as e:
+        e.job_log = log.getvalue()  # exception state is pickled back to the parent with it
+        raise
+    return log.getvalue()
+
+
+def print_url(url):
+    print(f"  URL: {url[:72]}{'…' if len(url) > 72 else ''}")
+
+
+def print_result(output_file, error):
+    if error is None:
+        print(f"  ✓ Saved: {output_file}")
+    else:
+        print(f"  ✗ Error: {error}")
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Batch-generate 3MFs from a URL list file (QR plates or containers/lids).",
@@ -78,7 +107,16 @@ def main():
         default=None,
         help="Alias for --body-height in container/container_full modes",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Parallel worker processes (0 = one per CPU core)",
+    )
     args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("--jobs must be >= 0")
 
     if not os.path.isfile(args.url_file):
         parser.error(f"Not a file: {args.url_file!r}")
@@ -113,30 +151,48 @@ def main():
 
     body_height = args.container_size or args.body_height
 
-    for i, url in enumerate(urls, 1):
-        output_file = os.path.join(args.output_dir, f"{output_prefix}_{i:02d}.3mf")
-        print(f"\n[{i}/{len(urls)}] Generating…")
-        print(f"  URL: {url[:72]}{'…' if len(url) > 72 else ''}")
-        try:
-            if args.mode == "qr_plate":
-                generate_qr_plate(url, output_file, args.size, args.style)
-            else:
-                generate_container(
-                    url,
-                    output_file,
-                    template=args.template,
-                    variant=args.variant,
-                    qr_size=container_qr_size,
-                    lids_only=args.mode == "container_lid",
-                    base_only=args.mode == "container",
-                    body_height=body_height,
-                )
-            print(f"  ✓ Saved: {output_file}")
-        except Exception as e:
-            print(f"  ✗ Error: {e}")
-            import traceback
+    jobs = [
+        (i, url, os.path.join(args.output_dir, f"{output_prefix}_{i:02d}.3mf"))
+        for i, url in enumerate(urls, 1)
+    ]
 
-            traceback.print_exc()
+    # Same (url, output_file) call shape for every mode; partial keeps it picklable for workers
+    if args.mode == "qr_plate":
+        task = partial(generate_qr_plate, size=args.size, style=args.style)
+    else:
+        task = partial(
+            generate_container,
+            template=args.template,
+            variant=args.variant,
+            qr_size=container_qr_size,
+            lids_only=args.mode == "container_lid",
+            base_only=args.mode == "container",
+            body_height=body_height,
+        )
+
+    if args.jobs != 1:
+        # Each URL is independent; per-process lru_caches still share base/text meshes per size
+        with ProcessPoolExecutor(max_workers=args.jobs or None) as pool:
+            futures = {}
+            for i, url, output_file in jobs:
+                futures[pool.submit(run_captured, task, url, output_file)] = (i, url, output_file)
+            for future in as_completed(futures):
+                i, url, output_file = futures[future]
+                error = future.exception()
+                print(f"\n[{i}/{len(urls)}] Finished…")
+                print_url(url)
+                print(getattr(error, "job_log", "") if error else future.result(), end="")
+                print_result(output_file, error)
+    else:
+        for i, url, output_file in jobs:
+            print(f"\n[{i}/{len(urls)}] Generating…")
+            print_url(url)
+            try:
+                task(url, output_file)
+                error = None
+            except Exception as e:
+                error = e
+            print_result(output_file, error)
 
     print(f"\n{'=' * 60}")
     print(f"Done. {len(urls)} file(s) in {args.output_dir!r}")
@@ -22,10 +22,10 @@ import trimesh
 
 from generate_3d_qr import (
     OUTPUT_DIR,
-    create_box_triangles,
-    generate_qr_code,
+    create_qr_boxes,
+    generate_qr_matrix,
     get_dimensions,
-    qr_to_array,
+    write_3mf,
 )
 
 CONTAINER_DIR = os.path.join(os.path.dirname(__file__), "containers")
@@ -72,55 +72,32 @@ def load_mesh_from_3mf_object(zip_path, object_filename):
     root = ET.fromstring(data)
     ns = {"m": "http://schemas.microsoft.com/3dmanufacturing/core/2015/02"}
 
-    vertices = []
-    for v in root.findall(".//m:vertex", ns):
-        vertices.append([float(v.get("x")), float(v.get("y")), float(v.get("z"))])
+    # Element counts are known up front, so fill preallocated arrays directly
+    vertex_elems = root.findall(".//m:vertex", ns)
+    vertices = np.fromiter(
+        (float(v.get(k)) for v in vertex_elems for k in ("x", "y", "z")),
+        dtype=float, count=3 * len(vertex_elems),
+    ).reshape(-1, 3)
 
-    faces = []
-    for t in root.findall(".//m:triangle", ns):
-        faces.append([int(t.get("v1")), int(t.get("v2")), int(t.get("v3"))])
+    triangle_elems = root.findall(".//m:triangle", ns)
+    faces = np.fromiter(
+        (int(t.get(k)) for t in triangle_elems for k in ("v1", "v2", "v3")),
+        dtype=int, count=3 * len(triangle_elems),
+    ).reshape(-1, 3)
 
-    return trimesh.Trimesh(vertices=np.array(vertices), faces=np.array(faces))
+    return trimesh.Trimesh(vertices=vertices, faces=faces)
 
 
 def build_qr_mesh(url, qr_size_mm, base_z, qr_height=0.9):
     """Build the white QR mesh at the given Z offset (no base plate, no text)."""
-    qr_img = generate_qr_code(url, size=200)
-    qr_array = qr_to_array(qr_img)
+    qr_array = generate_qr_matrix(url)
 
     dims = get_dimensions(qr_size_mm)
-    pixel_size = dims["qr_size_mm"] / qr_array.shape[0]
+    pixel_size = dims.qr_size_mm / qr_array.shape[0]
     square_size = pixel_size * 0.95
 
-    qr_triangles = []
-    for i in range(qr_array.shape[0]):
-        for j in range(qr_array.shape[1]):
-            if qr_array[i, j] == 1:
-                x = (j - qr_array.shape[1] / 2) * pixel_size
-                y = (qr_array.shape[0] / 2 - i) * pixel_size
-                qr_triangles.extend(
-                    create_box_triangles(x, y, base_z, square_size, square_size, qr_height)
-                )
-
-    qr_triangles = np.array(qr_triangles)
-    qr_vertices = qr_triangles.reshape(-1, 3)
-    qr_faces = np.arange(len(qr_vertices)).reshape(-1, 3)
-    mesh = trimesh.Trimesh(vertices=qr_vertices, faces=qr_faces)
-    mesh.merge_vertices()
-    return mesh
-
-
-def mesh_to_verts_tris_xml(mesh_obj, material_index):
-    """Serialize a trimesh to 3MF vertex/triangle XML fragments."""
-    verts_xml = ""
-    for v in mesh_obj.vertices:
-        verts_xml += f'          <vertex x="{v[0]:.6f}" y="{v[1]:.6f}" z="{v[2]:.6f}" />\n'
-
-    tris_xml = ""
-    for f in mesh_obj.faces:
-        tris_xml += f'          <triangle v1="{f[0]}" v2="{f[1]}" v3="{f[2]}" pid="1" p1="{material_index}" />\n'
-
-    return verts_xml, tris_xml
+    qr_vertices, qr_faces = create_qr_boxes(qr_array, pixel_size, base_z, square_size, qr_height)
+    return trimesh.Trimesh(vertices=qr_vertices, faces=qr_faces, process=False)
 
 
 def apply_body_height_mode(container_mesh, mode, preserve_top_mm):
@@ -184,19 +161,17 @@ def generate_container(
         qr_size_mm = qr_size
 
     print(f"  Loading container template ({variant})…")
-    container_mesh = load_mesh_from_3mf_object(template, spec["container"])
+    container_mesh = None if lids_only else load_mesh_from_3mf_object(template, spec["container"])
     lid_mesh = None if base_only else load_mesh_from_3mf_object(template, spec["lid"])
 
     # Shift both to Z=0 (bottom on build plate)
-    container_mesh.vertices[:, 2] -= spec["container_bottom_z"]
-    if lid_mesh is not None:
-        lid_mesh.vertices[:, 2] -= spec["lid_bottom_z"]
-
-    if not lids_only:
+    if container_mesh is not None:
+        container_mesh.vertices[:, 2] -= spec["container_bottom_z"]
         # Keep top clasp area unchanged; stretch/compress lower body only.
         apply_body_height_mode(container_mesh, body_height, preserve_top_mm=8.0)
+    if lid_mesh is not None:
+        lid_mesh.vertices[:, 2] -= spec["lid_bottom_z"]
 
-    lid_verts = lid_tris = qr_verts = qr_tris = None
     if not base_only:
         lid_top_z = spec["lid_top_z"] - spec["lid_bottom_z"]
 
@@ -211,181 +186,22 @@ def generate_container(
         qr_mesh = build_qr_mesh(url, qr_size_mm, base_z=qr_base_z)
         qr_mesh.vertices[:, 0] += x_offset
 
-        lid_verts, lid_tris = mesh_to_verts_tris_xml(lid_mesh, 0)
-        qr_verts, qr_tris = mesh_to_verts_tris_xml(qr_mesh, 1)
-
+    # Layers are (name, mesh, extruder); groups list the object ids of each build item
     if base_only:
-        container_verts, container_tris = mesh_to_verts_tris_xml(container_mesh, 0)
-        resources_xml = f"""    <object id=\"1\" name=\"container\" type=\"model\">
-      <mesh>
-        <vertices>
-{container_verts}        </vertices>
-        <triangles>
-{container_tris}        </triangles>
-      </mesh>
-    </object>"""
-        build_xml = """  <build>
-    <item objectid=\"1\" />
-  </build>"""
-        model_settings_config = """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
-<config>
-  <object id=\"1\">
-    <metadata key=\"extruder\" value=\"1\"/>
-    <metadata key=\"name\" value=\"container\"/>
-  </object>
-</config>"""
+        layers = [("container", container_mesh, 1)]
+        groups = []
     elif lids_only:
-        resources_xml = f"""    <object id=\"1\" name=\"lid\" type=\"model\">
-      <mesh>
-        <vertices>
-{lid_verts}        </vertices>
-        <triangles>
-{lid_tris}        </triangles>
-      </mesh>
-    </object>
-    <object id=\"2\" name=\"qr_code\" type=\"model\">
-      <mesh>
-        <vertices>
-{qr_verts}        </vertices>
-        <triangles>
-{qr_tris}        </triangles>
-      </mesh>
-    </object>
-    <object id=\"3\" name=\"lid_group\" type=\"model\">
-      <components>
-        <component objectid=\"1\" />
-        <component objectid=\"2\" />
-      </components>
-    </object>"""
-        build_xml = """  <build>
-    <item objectid=\"3\" />
-  </build>"""
-        model_settings_config = """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
-<config>
-  <object id=\"1\">
-    <metadata key=\"extruder\" value=\"1\"/>
-    <metadata key=\"name\" value=\"lid\"/>
-  </object>
-  <object id=\"2\">
-    <metadata key=\"extruder\" value=\"2\"/>
-    <metadata key=\"name\" value=\"qr_code\"/>
-  </object>
-  <object id=\"3\">
-    <metadata key=\"name\" value=\"lid_group\"/>
-    <part id=\"1\">
-      <metadata key=\"extruder\" value=\"1\"/>
-    </part>
-    <part id=\"2\">
-      <metadata key=\"extruder\" value=\"2\"/>
-    </part>
-  </object>
-</config>"""
+        layers = [("lid", lid_mesh, 1), ("qr_code", qr_mesh, 2)]
+        groups = [("lid_group", [1, 2])]
     else:
-        container_verts, container_tris = mesh_to_verts_tris_xml(container_mesh, 0)
-        resources_xml = f"""    <object id=\"1\" name=\"container\" type=\"model\">
-      <mesh>
-        <vertices>
-{container_verts}        </vertices>
-        <triangles>
-{container_tris}        </triangles>
-      </mesh>
-    </object>
-    <object id=\"2\" name=\"lid\" type=\"model\">
-      <mesh>
-        <vertices>
-{lid_verts}        </vertices>
-        <triangles>
-{lid_tris}        </triangles>
-      </mesh>
-    </object>
-    <object id=\"3\" name=\"qr_code\" type=\"model\">
-      <mesh>
-        <vertices>
-{qr_verts}        </vertices>
-        <triangles>
-{qr_tris}        </triangles>
-      </mesh>
-    </object>
-    <object id=\"4\" name=\"container_group\" type=\"model\">
-      <components>
-        <component objectid=\"1\" />
-      </components>
-    </object>
-    <object id=\"5\" name=\"lid_group\" type=\"model\">
-      <components>
-        <component objectid=\"2\" />
-        <component objectid=\"3\" />
-      </components>
-    </object>"""
-        build_xml = """  <build>
-    <item objectid=\"4\" />
-    <item objectid=\"5\" />
-  </build>"""
-        model_settings_config = """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
-<config>
-  <object id=\"1\">
-    <metadata key=\"extruder\" value=\"1\"/>
-    <metadata key=\"name\" value=\"container\"/>
-  </object>
-  <object id=\"2\">
-    <metadata key=\"extruder\" value=\"1\"/>
-    <metadata key=\"name\" value=\"lid\"/>
-  </object>
-  <object id=\"3\">
-    <metadata key=\"extruder\" value=\"2\"/>
-    <metadata key=\"name\" value=\"qr_code\"/>
-  </object>
-  <object id=\"4\">
-    <metadata key=\"name\" value=\"container_group\"/>
-    <part id=\"1\">
-      <metadata key=\"extruder\" value=\"1\"/>
-    </part>
-  </object>
-  <object id=\"5\">
-    <metadata key=\"name\" value=\"lid_group\"/>
-    <part id=\"2\">
-      <metadata key=\"extruder\" value=\"1\"/>
-    </part>
-    <part id=\"3\">
-      <metadata key=\"extruder\" value=\"2\"/>
-    </part>
-  </object>
-</config>"""
-
-    model_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
-<model unit="millimeter" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02" xmlns:m="http://schemas.microsoft.com/3dmanufacturing/material/2015/02">
-  <metadata name="Application">TreasureQR Generator</metadata>
-  <resources>
-    <m:basematerials id="1">
-      <m:base name="Green" displaycolor="#00AA00" />
-      <m:base name="White" displaycolor="#FFFFFF" />
-    </m:basematerials>
-{resources_xml}
-  </resources>
-{build_xml}
-</model>'''
-
-    content_types_xml = '''<?xml version="1.0" encoding="UTF-8"?>
-<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
-  <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml" />
-  <Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml" />
-  <Default Extension="config" ContentType="text/xml" />
-</Types>'''
-
-    rels_xml = '''<?xml version="1.0" encoding="UTF-8"?>
-<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
-  <Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel" />
-</Relationships>'''
+        layers = [("container", container_mesh, 1), ("lid", lid_mesh, 1), ("qr_code", qr_mesh, 2)]
+        groups = [("container_group", [1]), ("lid_group", [2, 3])]
 
     output_dir = os.path.dirname(output_file)
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
 
-    with zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr("[Content_Types].xml", content_types_xml)
-        zf.writestr("_rels/.rels", rels_xml)
-        zf.writestr("3D/3dmodel.model", model_xml)
-        zf.writestr("Metadata/model_settings.config", model_settings_config)
+    write_3mf(output_file, layers, groups)
 
     if lids_only:
         print(f"✓ Created lid-only 3MF: {output_file}")